@@ -1,7 +1,18 @@
+import argparse
+import bisect
 import csv
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
 import sys
+from array import array
+from collections import Counter, OrderedDict
 
-from util import Node, StackFrontier, QueueFrontier
+from util import Node, IndexedQueueFrontier
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,11 +23,65 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# CompactGraph holding people and movies when loaded with compact=True
+graph = None
 
-def load_data(directory):
+# Optional PathCache and LandmarkIndex consulted by shortest_path
+path_cache = None
+landmarks = None
+
+# NameIndex over `names`, built on first use by name_candidates
+name_index = None
+
+# Rows parsed at a time by the streaming CSV loader
+CHUNK_SIZE = 10000
+
+# Subdirectory of the data directory holding the binary snapshot
+SNAPSHOT_DIR = ".snapshot"
+SNAPSHOT_VERSION = 2
+
+
+def load_data(directory, compact=False, snapshot=False,
+              costars=False, costar_budget=None,
+              min_year=None, max_year=None, min_movies=0):
     """
     Load data from CSV files into memory.
+
+    If `compact` is true, the people/movies graph is kept in a
+    CompactGraph instead of the `people` and `movies` dictionaries.
+    If `snapshot` is true, the compact graph is loaded from a binary
+    snapshot of the CSV files, (re)building it when missing or stale.
+    If `costars` is true, the compact graph also precomputes each
+    person's co-stars, unless that would take more than `costar_budget`
+    bytes.
+
+    Giving `min_year`, `max_year` or `min_movies` streams the CSV files
+    into a compact graph of only the movies released in that range and
+    the people starring in at least `min_movies` of them.
+
+    Returns a dictionary counting the people, movies and stars loaded,
+    and the rows dropped for each reason. With `costars`, it also says
+    under "costars" whether the co-stars were precomputed.
     """
+    global graph, landmarks, name_index
+    # Cached answers and indexes belong to the previous data
+    landmarks = None
+    name_index = None
+    if path_cache is not None:
+        path_cache.clear()
+    filters = dict(min_year=min_year, max_year=max_year, min_movies=min_movies)
+    if snapshot:
+        graph = load_snapshot(directory, names, **filters)
+    elif compact or costars or any(filters.values()):
+        graph = CompactGraph.from_csv(directory, names, **filters)
+    else:
+        graph = None
+    if graph is not None:
+        if costars:
+            return dict(graph.load_stats,
+                        costars=graph.build_costars(costar_budget))
+        return graph.load_stats
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -42,25 +107,520 @@ def load_data(directory):
             }
 
     # Load stars
+    dropped = Counter()
     with open(f"{directory}/stars.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            try:
+            if row["person_id"] not in people:
+                dropped["stars_unknown_person"] += 1
+            elif row["movie_id"] not in movies:
+                dropped["stars_unknown_movie"] += 1
+            else:
                 people[row["person_id"]]["movies"].add(row["movie_id"])
                 movies[row["movie_id"]]["stars"].add(row["person_id"])
-            except KeyError:
-                pass
+
+    stars = sum(len(person["movies"]) for person in people.values())
+    return {"people": len(people), "movies": len(movies), "stars": stars,
+            "dropped": dict(dropped)}
+
+
+class CompactGraph():
+    """
+    Bipartite people/movies graph with IMDB ids interned to dense
+    integers and adjacency stored as CSR arrays: the movies of person `i`
+    are `person_movies[person_offsets[i]:person_offsets[i + 1]]`, and
+    likewise for the stars of a movie.
+    """
+
+    def __init__(self, names=None):
+        self.names = names if names is not None else {}
+        self.person_ids = []
+        self.person_index = {}
+        self.person_names = []
+        self.person_births = []
+        self.movie_ids = []
+        self.movie_index = {}
+        self.movie_titles = []
+        self.movie_years = []
+        self.person_offsets = array("i", [0])
+        self.person_movies = array("i")
+        self.movie_offsets = array("i", [0])
+        self.movie_stars = array("i")
+        # Optional person -> co-star projection, in the same CSR layout
+        self.costar_offsets = None
+        self.costar_people = None
+        self.costar_movies = None
+        self.load_stats = None
+
+    @classmethod
+    def from_csv(cls, directory, names=None, min_year=None, max_year=None,
+                 min_movies=0, chunk_size=CHUNK_SIZE):
+        """
+        Build a graph from the people, movies and stars CSV files,
+        filling `names` with lowercase names to sets of person_ids.
+
+        Rows are streamed `chunk_size` at a time straight into the
+        interned lists and edge arrays. Only movies released between
+        `min_year` and `max_year` are kept, and then only people starring
+        in at least `min_movies` of them. Counts of what was loaded and
+        dropped are left in `load_stats`.
+        """
+        self = cls(names)
+        dropped = Counter()
+        year_filter = min_year is not None or max_year is not None
+
+        for chunk in _read_csv(f"{directory}/people.csv",
+                               ("id", "name", "birth"), chunk_size):
+            for person_id, name, birth in chunk:
+                if person_id in self.person_index:
+                    dropped["people_duplicate_id"] += 1
+                    continue
+                self.add_person(person_id, name, birth)
+
+        for chunk in _read_csv(f"{directory}/movies.csv",
+                               ("id", "title", "year"), chunk_size):
+            for movie_id, title, year in chunk:
+                if movie_id in self.movie_index:
+                    dropped["movies_duplicate_id"] += 1
+                    continue
+                if year_filter:
+                    try:
+                        released = int(year)
+                    except ValueError:
+                        dropped["movies_unknown_year"] += 1
+                        continue
+                    if ((min_year is not None and released < min_year) or
+                            (max_year is not None and released > max_year)):
+                        dropped["movies_outside_years"] += 1
+                        continue
+                self.add_movie(movie_id, title, year)
+
+        # Collect edges as parallel index arrays, then pack them into CSR
+        stars_people = array("i")
+        stars_movies = array("i")
+        for chunk in _read_csv(f"{directory}/stars.csv",
+                               ("person_id", "movie_id"), chunk_size):
+            for person_id, movie_id in chunk:
+                person = self.person_index.get(person_id)
+                movie = self.movie_index.get(movie_id)
+                if person is None:
+                    dropped["stars_unknown_person"] += 1
+                elif movie is None:
+                    dropped["stars_unknown_movie"] += 1
+                else:
+                    stars_people.append(person)
+                    stars_movies.append(movie)
+        self.set_edges(stars_people, stars_movies)
+        del stars_people, stars_movies
+
+        if min_movies:
+            dropped["people_below_min_movies"] = self.drop_people(min_movies)
+
+        self.load_stats = {
+            "people": len(self.person_ids),
+            "movies": len(self.movie_ids),
+            "stars": len(self.person_movies),
+            "dropped": {reason: count for reason, count in dropped.items() if count},
+        }
+        return self
+
+    def drop_people(self, min_movies):
+        """
+        Remove everyone starring in fewer than `min_movies` movies,
+        renumbering the rest. Returns the number of people removed.
+        """
+        offsets, person_movies = self.person_offsets, self.person_movies
+        old_ids, old_names, old_births = (
+            self.person_ids, self.person_names, self.person_births)
+        self.person_ids, self.person_names, self.person_births = [], [], []
+        self.person_index = {}
+
+        stars_people = array("i")
+        stars_movies = array("i")
+        for old in range(len(old_ids)):
+            start, end = offsets[old], offsets[old + 1]
+            if end - start < min_movies:
+                person_ids = self.names[old_names[old].lower()]
+                person_ids.discard(old_ids[old])
+                if not person_ids:
+                    del self.names[old_names[old].lower()]
+                continue
+            index = len(self.person_ids)
+            self.person_ids.append(old_ids[old])
+            self.person_index[old_ids[old]] = index
+            self.person_names.append(old_names[old])
+            self.person_births.append(old_births[old])
+            for i in range(start, end):
+                stars_people.append(index)
+                stars_movies.append(person_movies[i])
+
+        self.set_edges(stars_people, stars_movies)
+        return len(old_ids) - len(self.person_ids)
+
+    # CSR arrays written to the snapshot as raw machine integers
+    ARRAYS = ("person_offsets", "person_movies", "movie_offsets", "movie_stars")
+
+    def save(self, path, manifest):
+        """
+        Write the graph to the snapshot directory `path`, tagged with the
+        `manifest` of the CSV files it was built from.
+        """
+        os.makedirs(path, exist_ok=True)
+        # An older snapshot stops being valid before its arrays are replaced
+        try:
+            os.remove(os.path.join(path, "meta.pickle"))
+        except FileNotFoundError:
+            pass
+        for name in self.ARRAYS:
+            with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+                getattr(self, name).tofile(f)
+
+        # Metadata goes last so a partially written snapshot is never valid
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "manifest": manifest,
+            "names": self.names,
+            "person_ids": self.person_ids,
+            "person_names": self.person_names,
+            "person_births": self.person_births,
+            "movie_ids": self.movie_ids,
+            "movie_titles": self.movie_titles,
+            "movie_years": self.movie_years,
+            "load_stats": self.load_stats,
+        }
+        tmp = os.path.join(path, "meta.pickle.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(path, "meta.pickle"))
+
+    @classmethod
+    def load(cls, path, manifest, names=None):
+        """
+        Load a graph from the snapshot directory `path`, memory-mapping
+        its CSR arrays. Returns None if there is no snapshot or it was
+        not built from CSV files matching `manifest`.
+        """
+        try:
+            with open(os.path.join(path, "meta.pickle"), "rb") as f:
+                meta = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("manifest") != manifest:
+            return None
+
+        self = cls(names)
+        self.names.update(meta["names"])
+        for key in ("person_ids", "person_names", "person_births",
+                    "movie_ids", "movie_titles", "movie_years", "load_stats"):
+            setattr(self, key, meta[key])
+        self.person_index = {id: i for i, id in enumerate(self.person_ids)}
+        self.movie_index = {id: i for i, id in enumerate(self.movie_ids)}
+        for name in self.ARRAYS:
+            setattr(self, name, _map_array(os.path.join(path, f"{name}.bin")))
+        return self
+
+    def add_person(self, person_id, name, birth):
+        """
+        Intern a person and return their index.
+        """
+        index = len(self.person_ids)
+        self.person_ids.append(person_id)
+        self.person_index[person_id] = index
+        self.person_names.append(name)
+        self.person_births.append(birth)
+        self.names.setdefault(name.lower(), set()).add(person_id)
+        return index
+
+    def add_movie(self, movie_id, title, year):
+        """
+        Intern a movie and return its index.
+        """
+        index = len(self.movie_ids)
+        self.movie_ids.append(movie_id)
+        self.movie_index[movie_id] = index
+        self.movie_titles.append(title)
+        self.movie_years.append(year)
+        return index
+
+    def set_edges(self, stars_people, stars_movies):
+        """
+        Replace the adjacency with the given (person, movie) index pairs.
+        """
+        self.person_offsets, self.person_movies = _csr(
+            stars_people, stars_movies, len(self.person_ids))
+        self.movie_offsets, self.movie_stars = _csr(
+            stars_movies, stars_people, len(self.movie_ids))
+
+    def build_costars(self, memory_budget=None):
+        """
+        Precompute each person's co-stars with one representative movie
+        per co-star, so neighbors() becomes a pair of array slices.
+
+        Returns False without building anything if the projection could
+        need more than `memory_budget` bytes.
+        """
+        movie_offsets, movie_stars = self.movie_offsets, self.movie_stars
+        if memory_budget is not None:
+            # Upper bound: every star of a movie paired with every other star
+            edges = 0
+            for movie in range(len(self.movie_ids)):
+                stars = movie_offsets[movie + 1] - movie_offsets[movie]
+                edges += stars * (stars - 1)
+            if 2 * 4 * edges > memory_budget:
+                return False
+
+        offsets = array("i", [0])
+        costar_people = array("i")
+        costar_movies = array("i")
+        person_offsets, person_movies = self.person_offsets, self.person_movies
+        for person in range(len(self.person_ids)):
+            costars = dict()
+            for i in range(person_offsets[person], person_offsets[person + 1]):
+                movie = person_movies[i]
+                for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                    costars.setdefault(movie_stars[j], movie)
+            costars.pop(person, None)
+            for costar in sorted(costars):
+                costar_people.append(costar)
+                costar_movies.append(costars[costar])
+            offsets.append(len(costar_people))
+
+        self.costar_offsets = offsets
+        self.costar_people = costar_people
+        self.costar_movies = costar_movies
+        return True
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people
+        who starred with the person at index `person`.
+        """
+        if self.costar_offsets is not None:
+            start = self.costar_offsets[person]
+            end = self.costar_offsets[person + 1]
+            return zip(self.costar_movies[start:end], self.costar_people[start:end])
+        return self._movie_neighbors(person)
+
+    def _movie_neighbors(self, person):
+        person_movies, movie_offsets, movie_stars = (
+            self.person_movies, self.movie_offsets, self.movie_stars)
+        for i in range(self.person_offsets[person], self.person_offsets[person + 1]):
+            movie = person_movies[i]
+            for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                yield movie, movie_stars[j]
+
+    def neighbor_ids(self, person_id):
+        """
+        Returns (movie_id, person_id) pairs for people
+        who starred with a given person.
+        """
+        return set(
+            (self.movie_ids[movie], self.person_ids[person])
+            for movie, person in self.neighbors(self.person_index[person_id])
+        )
+
+    def shortest_path(self, source, target, bidirectional=False, max_length=None):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs
+        that connect the source to the target, searching on indices.
+
+        If no possible path, or none of at most `max_length` steps
+        when searching bidirectionally, returns None.
+        """
+        source, target = self.person_index[source], self.person_index[target]
+        if bidirectional:
+            path = bidirectional_search(source, target, self.neighbors, max_length)
+        else:
+            path = breadth_first_search(source, target, self.neighbors)
+        return self.path_ids(path)
+
+    def paths_from(self, source, targets):
+        """
+        Returns a dictionary mapping each person_id in `targets` to the
+        shortest list of (movie_id, person_id) pairs from the source,
+        or None if not connected, using a single search from the source.
+        """
+        indices = {target: self.person_index[target] for target in targets}
+        parents = breadth_first_tree(self.person_index[source], self.neighbors,
+                                     indices.values())
+        return {target: self.path_ids(tree_path(parents, index))
+                for target, index in indices.items()}
+
+    def single_source(self, source):
+        """
+        Returns (distances, parents) keyed by person_id for a full BFS
+        from the source, as for the module-level single_source.
+        """
+        distances, parents = breadth_first_distances(
+            self.person_index[source], self.neighbors)
+        person_ids, movie_ids = self.person_ids, self.movie_ids
+        return (
+            {person_ids[person]: distance for person, distance in distances.items()},
+            {person_ids[person]: parent and (movie_ids[parent[0]], person_ids[parent[1]])
+             for person, parent in parents.items()},
+        )
+
+    def path_ids(self, path):
+        """
+        Translates a path of (movie, person) indices back to IMDB ids.
+        """
+        if path is None:
+            return None
+        return [(self.movie_ids[movie], self.person_ids[person])
+                for movie, person in path]
+
+
+def load_snapshot(directory, names=None, **filters):
+    """
+    Return a CompactGraph for `directory`, loaded from its binary
+    snapshot if it matches the CSV files and `filters`, or parsed from
+    the CSV files and saved as a new snapshot otherwise, if it can be.
+    """
+    path = os.path.join(directory, SNAPSHOT_DIR)
+    manifest = _csv_manifest(directory)
+    manifest["filters"] = filters
+    if names is not None:
+        names.clear()
+    loaded = CompactGraph.load(path, manifest, names)
+    if loaded is not None:
+        return loaded
+    loaded = CompactGraph.from_csv(directory, names, **filters)
+    try:
+        loaded.save(path, manifest)
+    except OSError:
+        # An unwritable data directory only costs the next load a parse
+        pass
+    return loaded
+
+
+def _csv_manifest(directory):
+    """
+    Returns the size and modification time of each CSV file.
+    """
+    manifest = {}
+    for filename in ("people.csv", "movies.csv", "stars.csv"):
+        stat = os.stat(os.path.join(directory, filename))
+        manifest[filename] = (stat.st_size, stat.st_mtime_ns)
+    return manifest
+
+
+def _read_csv(filename, columns, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of up to `chunk_size` tuples holding the given columns
+    of each row of a CSV file with a header row.
+    """
+    with open(filename, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [header.index(column) for column in columns]
+        while True:
+            chunk = [tuple(row[i] for i in positions)
+                     for row in itertools.islice(reader, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+
+def _map_array(filename):
+    """
+    Returns a read-only integer view of a file written by array.tofile.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return array("i")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(buffer).cast("i")
+
+
+def _csr(rows, cols, size):
+    """
+    Pack parallel `rows`/`cols` index arrays into CSR (offsets, values)
+    arrays for `size` rows, with each row sorted and free of duplicates.
+    """
+    counts = array("i", bytes(4 * (size + 1)))
+    for row in rows:
+        counts[row + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+
+    values = array("i", bytes(4 * len(rows)))
+    cursor = counts[:-1]
+    for row, col in zip(rows, cols):
+        values[cursor[row]] = col
+        cursor[row] += 1
+
+    offsets = array("i", [0])
+    packed = array("i")
+    for i in range(size):
+        packed.extend(sorted(set(values[counts[i]:counts[i + 1]])))
+        offsets.append(len(packed))
+    return offsets, packed
 
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(prog="python degrees.py")
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--compact", action="store_true",
+                        help="store the graph in integer-indexed CSR arrays")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="load the compact graph from a binary snapshot")
+    parser.add_argument("--costars", action="store_true",
+                        help="precompute co-stars of every person at load time")
+    parser.add_argument("--costar-budget", metavar="MB", type=float, default=None,
+                        help="skip --costars if it could need more than MB megabytes")
+    parser.add_argument("--min-year", type=int, default=None,
+                        help="only load movies released in or after this year")
+    parser.add_argument("--max-year", type=int, default=None,
+                        help="only load movies released in or before this year")
+    parser.add_argument("--min-movies", type=int, default=0,
+                        help="only load people starring in this many loaded movies")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer tab-separated source/target pairs from "
+                             "FILE ('-' for stdin) as JSON lines")
+    parser.add_argument("--distribution", metavar="SOURCE", nargs="+",
+                        help="print the degree-of-separation histogram of "
+                             "every person from each SOURCE as JSON lines")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes for --distribution")
+    args = parser.parse_args()
+
+    # Keep stdout clean for JSON lines in batch modes
+    log = sys.stderr if args.batch or args.distribution else sys.stdout
 
     # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    print("Loading data...", file=log)
+    loader = dict(
+        directory=args.directory, compact=args.compact, snapshot=args.snapshot,
+        costars=args.costars,
+        costar_budget=(None if args.costar_budget is None
+                       else int(args.costar_budget * 1024 * 1024)),
+        min_year=args.min_year, max_year=args.max_year, min_movies=args.min_movies,
+    )
+    stats = load_data(**loader)
+    print("Data loaded.", file=log)
+    for reason, count in stats["dropped"].items():
+        print(f"Dropped {count} rows: {reason.replace('_', ' ')}.", file=log)
+    if stats.get("costars") is False:
+        print("Co-stars not precomputed: they could exceed --costar-budget.", file=log)
+
+    if args.batch:
+        if args.batch == "-":
+            run_batch(sys.stdin, sys.stdout)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                run_batch(f, sys.stdout)
+        return
+
+    if args.distribution:
+        sources = []
+        for value in args.distribution:
+            source, error, _ = resolve_person(value)
+            if source is None:
+                sys.exit(f"{value}: {error}")
+            sources.append(source)
+        for source, histogram in degree_distribution(sources, args.processes, loader):
+            _write_result(sys.stdout, {"source": source, "histogram": histogram})
+        return
 
     source = person_id_for_name(input("Name: "))
     if source is None:
@@ -69,7 +629,7 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path = shortest_path(source, target, bidirectional=True)
 
     if path is None:
         print("Not connected.")
@@ -78,24 +638,300 @@ def main():
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = person_info(path[i][1])["name"]
+            person2 = person_info(path[i + 1][1])["name"]
+            movie = movie_info(path[i + 1][0])["title"]
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
-def shortest_path(source, target):
+def run_batch(lines, out):
+    """
+    Answer one query per line of `lines`, each a source and a target
+    (IMDB id or name) separated by a tab, writing one JSON object per
+    query to `out`.
+
+    Queries are grouped by source so each source is searched only once.
+    Results are written as each group finishes, tagged with their line number.
+    A name that cannot be resolved is reported with its closest candidates.
+    """
+    groups = dict()
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        result = {"line": number}
+        fields = line.split("\t")
+        if len(fields) != 2:
+            result["error"] = "expected source and target separated by a tab"
+            _write_result(out, result)
+            continue
+        result["source"], result["target"] = fields
+        source, error, candidates = resolve_person(fields[0])
+        if source is None:
+            result["error"] = f"source {error}"
+            result["candidates"] = candidates
+            _write_result(out, result)
+            continue
+        target, error, candidates = resolve_person(fields[1])
+        if target is None:
+            result["error"] = f"target {error}"
+            result["candidates"] = candidates
+            _write_result(out, result)
+            continue
+        result["source_id"], result["target_id"] = source, target
+        groups.setdefault(source, []).append(result)
+
+    for source, results in groups.items():
+        paths = paths_from(source, set(result["target_id"] for result in results))
+        for result in results:
+            path = paths[result["target_id"]]
+            result["degrees"] = None if path is None else len(path)
+            result["path"] = path
+            _write_result(out, result)
+
+
+def _write_result(out, result):
+    out.write(json.dumps(result) + "\n")
+    out.flush()
+
+
+def resolve_person(value):
+    """
+    Returns (person_id, None, []) for an IMDB id or an unambiguous name,
+    or (None, reason, candidates) if it cannot be resolved without
+    asking, with the closest matching people from `name_candidates`.
+    """
+    value = value.strip()
+    if (graph.person_index if graph is not None else people).get(value) is not None:
+        return value, None, []
+    person_ids = names.get(value.lower(), set())
+    if len(person_ids) == 0:
+        return None, "not found", name_candidates(value)
+    if len(person_ids) > 1:
+        return (None, f"ambiguous: {', '.join(sorted(person_ids))}",
+                name_candidates(value))
+    return next(iter(person_ids)), None, []
+
+
+def paths_from(source, targets):
+    """
+    Returns a dictionary mapping each person_id in `targets` to the
+    shortest list of (movie_id, person_id) pairs from the source,
+    or None if not connected, using a single search from the source.
+    """
+    if graph is not None:
+        return graph.paths_from(source, targets)
+    parents = breadth_first_tree(source, neighbors_for_person, targets)
+    return {target: tree_path(parents, target) for target in targets}
+
+
+def single_source(source):
+    """
+    Returns (distances, parents) for a full BFS from the source:
+    `distances` maps every reachable person_id to their degrees of
+    separation, and `parents` maps them to the (movie_id, person_id)
+    pair one step closer to the source (None for the source).
+    """
+    if graph is not None:
+        return graph.single_source(source)
+    return breadth_first_distances(source, neighbors_for_person)
+
+
+def degree_distribution(sources, processes=None, loader=None):
+    """
+    Yields (source, histogram) pairs, where `histogram` maps each degree
+    of separation to the number of people that far from the source.
+
+    Sources are fanned out over a pool of `processes` workers that share
+    the already-loaded graph when processes are forked. `loader`, the
+    keyword arguments to load_data, lets workers started without fork
+    load the data themselves.
+    """
+    with multiprocessing.Pool(processes, _init_worker, (loader,)) as pool:
+        chunksize = max(1, len(sources) // (4 * (processes or os.cpu_count() or 1)))
+        yield from pool.imap_unordered(_source_histogram, sources, chunksize)
+
+
+def _init_worker(loader):
+    if loader is not None and graph is None and not people:
+        load_data(**loader)
+
+
+def _source_histogram(source):
+    distances, _ = single_source(source)
+    return source, dict(sorted(Counter(distances.values()).items()))
+
+
+def shortest_path(source, target, bidirectional=False):
     """
     Returns the shortest list of (movie_id, person_id) pairs
     that connect the source to the target.
 
+    If `bidirectional` is true, search from both ends at once
+    and meet in the middle instead of expanding from the source only.
+
     If no possible path, returns None.
     """
+    if path_cache is not None:
+        hit, path = path_cache.lookup(source, target)
+        if hit:
+            return path
 
-    # TODO
+    max_length = None
+    if landmarks is not None:
+        lower, upper, via = landmarks.bounds(source, target)
+        if lower is None:
+            return _cache_path(source, target, None)
+        if upper is not None:
+            if lower == upper:
+                landmarks.hits += 1
+                return _cache_path(source, target, landmarks.path_via(via, source, target))
+            # Only a path shorter than the one through a landmark is worth finding
+            max_length = upper - 1
+            bidirectional = True
+
+    if graph is not None:
+        path = graph.shortest_path(source, target, bidirectional, max_length)
+    elif bidirectional:
+        path = bidirectional_search(source, target, neighbors_for_person, max_length)
+    else:
+        path = breadth_first_search(source, target, neighbors_for_person)
+    if path is None and max_length is not None:
+        path = landmarks.path_via(via, source, target)
+    return _cache_path(source, target, path)
+
+
+def _cache_path(source, target, path):
+    if path_cache is not None:
+        path_cache.store(source, target, path)
+    return path
+
+
+def enable_path_cache(maxsize=1024):
+    """
+    Make shortest_path remember up to `maxsize` recent answers.
+    """
+    global path_cache
+    path_cache = PathCache(maxsize)
+    return path_cache
+
+
+def build_landmarks(count=4):
+    """
+    Make shortest_path consult BFS distances from the `count` people
+    who starred in the most movies.
+    """
+    global landmarks
+    if graph is not None:
+        offsets = graph.person_offsets
+        degree = {person_id: offsets[i + 1] - offsets[i]
+                  for i, person_id in enumerate(graph.person_ids)}
+    else:
+        degree = {person_id: len(person["movies"]) for person_id, person in people.items()}
+    landmarks = LandmarkIndex(sorted(degree, key=degree.get, reverse=True)[:count])
+    return landmarks
+
+
+class PathCache():
+    """
+    Bounded LRU cache of shortest paths, shared by both directions of a pair.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, source, target):
+        """
+        Returns (True, path) for a cached pair, or (False, None).
+        """
+        if (source, target) in self.paths:
+            self.paths.move_to_end((source, target))
+            self.hits += 1
+            return True, self.paths[(source, target)]
+        if (target, source) in self.paths:
+            self.paths.move_to_end((target, source))
+            self.hits += 1
+            path = self.paths[(target, source)]
+            return True, None if path is None else reverse_path(target, path)
+        self.misses += 1
+        return False, None
+
+    def store(self, source, target, path):
+        self.paths[(source, target)] = path
+        self.paths.move_to_end((source, target))
+        if len(self.paths) > self.maxsize:
+            self.paths.popitem(last=False)
+
+    def clear(self):
+        self.paths.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.paths)}
+
+
+class LandmarkIndex():
+    """
+    Single-source BFS distances and parents from a few landmark people,
+    giving lower and upper bounds on the degrees between any two people.
+    """
+
+    def __init__(self, sources):
+        self.trees = {source: single_source(source) for source in sources}
+        # Queries answered by a landmark path without any search
+        self.hits = 0
+        # Queries known to be disconnected without any search
+        self.disconnected = 0
+
+    def bounds(self, source, target):
+        """
+        Returns (lower, upper, landmark) bounds on the degrees between the
+        source and target, where the path through `landmark` has length
+        `upper` (None if no landmark reaches both).
+
+        Returns (None, None, None) if the two are known not to be connected.
+        """
+        lower, upper, via = 0, None, None
+        for landmark, (distances, _) in self.trees.items():
+            d_source = distances.get(source)
+            d_target = distances.get(target)
+            if d_source is None and d_target is None:
+                continue
+            if d_source is None or d_target is None:
+                self.disconnected += 1
+                return None, None, None
+            lower = max(lower, abs(d_source - d_target))
+            if upper is None or d_source + d_target < upper:
+                upper, via = d_source + d_target, landmark
+        return lower, upper, via
+
+    def path_via(self, landmark, source, target):
+        """
+        Returns the list of (movie_id, person_id) pairs from the source
+        to the landmark and on to the target.
+        """
+        _, parents = self.trees[landmark]
+        return (reverse_path(landmark, tree_path(parents, source))
+                + tree_path(parents, target))
+
+    def stats(self):
+        return {"landmarks": len(self.trees), "hits": self.hits,
+                "disconnected": self.disconnected}
+
+
+def breadth_first_search(source, target, neighbors):
+    """
+    Returns the shortest list of (action, state) pairs that connect
+    the source to the target, where `neighbors(state)` yields the
+    (action, state) pairs reachable from a state.
+
+    If no possible path, returns None.
+    """
     # Using BFS to find NEAREST path...
     start = Node(state=source, parent=None, action=None) # create a node
-    frontier = QueueFrontier() # BFS for nearest degree
+    frontier = IndexedQueueFrontier() # BFS for nearest degree
     frontier.add(start) # add start to queue
 
     visited = set() # to check if already visited or not
@@ -114,27 +950,199 @@ def shortest_path(source, target):
                 data.reverse()
                 return data
             else:
-                neighbors = neighbors_for_person(node.state) # find all neighbour's_id and movie_id
-                for movie_id, neighbor_id in neighbors:
-                    if not frontier.contains_state(neighbor_id) and neighbor_id not in visited: # check if already visited or not OR in frontier
-                        node_neighbor = Node(state=neighbor_id, parent = node, action = movie_id)
+                for action, neighbor in neighbors(node.state): # find all neighbour's state and action
+                    if not frontier.contains_state(neighbor) and neighbor not in visited: # check if already visited or not OR in frontier
+                        node_neighbor = Node(state=neighbor, parent = node, action = action)
                         frontier.add(node_neighbor)
-        
-    raise NotImplementedError
 
 
-def person_id_for_name(name):
+def breadth_first_tree(source, neighbors, targets=None):
+    """
+    Returns a dictionary mapping every state reached by a BFS from the
+    source to its (action, previous state) pair, with None for the source.
+
+    If `targets` is given, stops as soon as all of them are reached.
+    """
+    parents = {source: None}
+    remaining = set(targets) - {source} if targets is not None else None
+    if remaining is not None and not remaining:
+        return parents
+
+    level = [source]
+    while level:
+        next_level = []
+        for state in level:
+            for action, neighbor in neighbors(state):
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = (action, state)
+                next_level.append(neighbor)
+                if remaining is not None:
+                    remaining.discard(neighbor)
+                    if not remaining:
+                        return parents
+        level = next_level
+    return parents
+
+
+def breadth_first_distances(source, neighbors):
+    """
+    Returns (distances, parents) for every state reachable from the
+    source: its number of steps from the source, and the (action,
+    previous state) pair it was reached by (None for the source).
+    """
+    distances = {source: 0}
+    parents = {source: None}
+    level = [source]
+    depth = 0
+    while level:
+        depth += 1
+        next_level = []
+        for state in level:
+            for action, neighbor in neighbors(state):
+                if neighbor in distances:
+                    continue
+                distances[neighbor] = depth
+                parents[neighbor] = (action, state)
+                next_level.append(neighbor)
+        level = next_level
+    return distances, parents
+
+
+def reverse_path(source, path):
+    """
+    Returns the list of (action, state) pairs walking `path`, which
+    starts at the source, backwards from its last state to the source.
+    """
+    states = [source] + [state for _, state in path]
+    return [(path[i][0], states[i]) for i in range(len(path) - 1, -1, -1)]
+
+
+def tree_path(parents, target):
+    """
+    Returns the list of (action, state) pairs leading from the root of
+    a BFS tree to the target, or None if the target was not reached.
+    """
+    if target not in parents:
+        return None
+    path = []
+    while parents[target] is not None:
+        action, previous = parents[target]
+        path.append((action, target))
+        target = previous
+    path.reverse()
+    return path
+
+
+def bidirectional_search(source, target, neighbors, max_length=None):
+    """
+    Returns the shortest list of (action, state) pairs that connect
+    the source to the target, where `neighbors(state)` yields the
+    (action, state) pairs reachable from a state.
+
+    Expands one whole BFS level at a time, always on the smaller side,
+    so the first level that touches the other side holds the shortest path.
+
+    If no possible path, or none of at most `max_length` steps, returns None.
+    """
+    if source == target:
+        return []
+
+    # Length of the paths the next expanded level could complete
+    length = 1
+
+    # Maps each reached state to (action, previous state) towards its root
+    forward = {source: None}
+    backward = {target: None}
+    forward_level = [source]
+    backward_level = [target]
+
+    while forward_level and backward_level:
+        if max_length is not None and length > max_length:
+            return None
+        length += 1
+
+        # Grow whichever side has fewer states to expand
+        grow_forward = len(forward_level) <= len(backward_level)
+        if grow_forward:
+            level, parents, others = forward_level, forward, backward
+        else:
+            level, parents, others = backward_level, backward, forward
+
+        next_level = []
+        meeting = None
+        for state in level:
+            for action, neighbor in neighbors(state):
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = (action, state)
+                next_level.append(neighbor)
+                if neighbor in others:
+                    length = _depth(parents, neighbor) + _depth(others, neighbor)
+                    if meeting is None or length < meeting[0]:
+                        meeting = (length, neighbor)
+
+        if meeting is not None:
+            return _join_paths(forward, backward, meeting[1])
+
+        if grow_forward:
+            forward_level = next_level
+        else:
+            backward_level = next_level
+
+    return None
+
+
+def _depth(parents, state):
+    """
+    Returns the number of steps from `state` back to the root of `parents`.
+    """
+    depth = 0
+    while parents[state] is not None:
+        state = parents[state][1]
+        depth += 1
+    return depth
+
+
+def _join_paths(forward, backward, meeting):
+    """
+    Returns the (action, state) path from the forward root to the
+    backward root through the `meeting` state reached by both searches.
+    """
+    path = []
+    state = meeting
+    while forward[state] is not None:
+        action, previous = forward[state]
+        path.append((action, state))
+        state = previous
+    path.reverse()
+
+    # Edges are undirected, so walking back towards the target reuses them
+    state = meeting
+    while backward[state] is not None:
+        action, following = backward[state]
+        path.append((action, following))
+        state = following
+    return path
+
+
+def person_id_for_name(name, interactive=True):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    If `interactive` is false, ambiguous names return None instead of
+    prompting; use name_candidates to rank the possible people.
     """
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
         return None
     elif len(person_ids) > 1:
+        if not interactive:
+            return None
         print(f"Which '{name}'?")
         for person_id in person_ids:
-            person = people[person_id]
+            person = person_info(person_id)
             name = person["name"]
             birth = person["birth"]
             print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
@@ -149,11 +1157,148 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+def name_candidates(query, limit=10):
+    """
+    Returns up to `limit` people whose names match the query, best first,
+    as dictionaries of id, name, birth, match ("exact", "prefix" or
+    "fuzzy") and a score between 0 and 1.
+    """
+    global name_index
+    if name_index is None:
+        name_index = NameIndex(names)
+    return name_index.search(query, limit)
+
+
+class NameIndex():
+    """
+    Prefix index and trigram index over lowercase names.
+    """
+
+    # Most names drawn as candidates for a fuzzy match, and scored exactly
+    FUZZY_CANDIDATES = 1000
+    FUZZY_SCORED = 100
+
+    def __init__(self, names):
+        self.names = names
+        # Sorted names of each length, so the shortest prefix matches,
+        # which score best, are found without scanning longer names
+        self.by_length = dict()
+        for key in sorted(names):
+            self.by_length.setdefault(len(key), []).append(key)
+        self.lengths = sorted(self.by_length)
+
+        self.trigrams = dict()
+        # Distinct trigrams of the few names with a repeated trigram;
+        # every other name has one per character plus one
+        self.trigram_counts = dict()
+        for key in names:
+            trigrams = _trigrams(key)
+            for trigram in trigrams:
+                self.trigrams.setdefault(trigram, []).append(key)
+            if len(trigrams) != len(key) + 1:
+                self.trigram_counts[key] = len(trigrams)
+
+    def search(self, query, limit=10):
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        # Best (match rank, score) per matching name
+        matches = dict()
+        if query in self.names:
+            matches[query] = (2, 1.0)
+
+        # Names starting with the query, shortest first
+        prefixed = 0
+        for length in self.lengths:
+            if length < len(query):
+                continue
+            keys = self.by_length[length]
+            start = bisect.bisect_left(keys, query)
+            end = bisect.bisect_left(keys, query + "\uffff", start)
+            for key in keys[start:min(end, start + limit + 1)]:
+                matches.setdefault(key, (1, len(query) / len(key)))
+                prefixed += 1
+            if prefixed > limit:
+                break
+
+        # Only fall back to fuzzy matches when there are too few others,
+        # drawing candidates from the rarest trigrams of the query
+        if len(matches) < limit:
+            query_trigrams = _trigrams(query)
+            hits = Counter()
+            drawn = 0
+            for trigram in sorted(query_trigrams,
+                                  key=lambda t: len(self.trigrams.get(t, ()))):
+                postings = self.trigrams.get(trigram, ())
+                if drawn + len(postings) > self.FUZZY_CANDIDATES:
+                    if not drawn:
+                        hits.update(itertools.islice(postings, self.FUZZY_CANDIDATES))
+                    break
+                hits.update(postings)
+                drawn += len(postings)
+            # Only names sharing the most of those trigrams are scored, and a
+            # trigram is shared exactly when it occurs in the padded name
+            counts = self.trigram_counts
+            for key, _ in hits.most_common(self.FUZZY_SCORED + len(matches)):
+                if key in matches:
+                    continue
+                padded = f"  {key} "
+                shared = sum(trigram in padded for trigram in query_trigrams)
+                union = len(query_trigrams) + counts.get(key, len(key) + 1) - shared
+                matches[key] = (0, shared / union)
+
+        ranked = heapq.nsmallest(
+            limit, matches.items(),
+            key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        candidates = []
+        for key, (rank, score) in ranked:
+            for person_id in sorted(self.names[key]):
+                person = person_info(person_id)
+                candidates.append({
+                    "id": person_id,
+                    "name": person["name"],
+                    "birth": person["birth"],
+                    "match": ("fuzzy", "prefix", "exact")[rank],
+                    "score": round(score, 4),
+                })
+        return candidates[:limit]
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def person_info(person_id):
+    """
+    Returns a dictionary of name and birth for a person.
+    """
+    if graph is not None:
+        index = graph.person_index[person_id]
+        return {"name": graph.person_names[index],
+                "birth": graph.person_births[index]}
+    return people[person_id]
+
+
+def movie_info(movie_id):
+    """
+    Returns a dictionary of title and year for a movie.
+    """
+    if graph is not None:
+        index = graph.movie_index[movie_id]
+        return {"title": graph.movie_titles[index],
+                "year": graph.movie_years[index]}
+    return movies[movie_id]
+
+
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
+    if graph is not None:
+        return graph.neighbor_ids(person_id)
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
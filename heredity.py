@@ -1,6 +1,11 @@
+import argparse
 import csv
 import itertools
-import sys
+import math
+import multiprocessing
+import os
+import random
+import time
 
 PROBS = {
 
@@ -37,61 +42,59 @@ PROBS = {
 }
 
 
-def main():
+# Possible numbers of copies of the gene
+GENES = (0, 1, 2)
 
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
-
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+def main():
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+    # Check for proper usage
+    parser = argparse.ArgumentParser(prog="python heredity.py")
+    parser.add_argument("data")
+    parser.add_argument("--method", default="eliminate",
+                        choices=("eliminate", "enumerate", "vectorized",
+                                 "likelihood", "gibbs"),
+                        help="exact inference by variable elimination, or "
+                             "by enumerating every possible world one at a "
+                             "time or in NumPy batches; or approximate "
+                             "inference by likelihood weighting or Gibbs sampling")
+    parser.add_argument("--samples", type=int, default=10000,
+                        help="samples to draw when sampling")
+    parser.add_argument("--seconds", type=float, default=None,
+                        help="stop sampling after this many seconds")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes drawing samples")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes solving separate families")
+    args = parser.parse_args()
+    datasets = load_datasets(args.data)
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+    results = solve_families(datasets, args.method, args.jobs,
+                             samples=args.samples, seconds=args.seconds,
+                             processes=args.processes, seed=args.seed)
+    for dataset, people in datasets.items():
+        if len(datasets) > 1:
+            print(f"== {dataset} ==")
+        probabilities, errors = results[dataset]
+        print_probabilities(people, probabilities, errors)
 
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
 
-    # Print results
+def print_probabilities(people, probabilities, errors=None):
+    """
+    Print the gene and trait distributions of every person,
+    with their standard errors if given.
+    """
     for person in people:
         print(f"{person}:")
         for field in probabilities[person]:
             print(f"  {field.capitalize()}:")
             for value in probabilities[person][field]:
                 p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+                if errors is None:
+                    print(f"    {value}: {p:.4f}")
+                else:
+                    print(f"    {value}: {p:.4f} ± {errors[person][field][value]:.4f}")
 
 
 def load_data(filename):
@@ -116,6 +119,110 @@ def load_data(filename):
     return data
 
 
+def load_datasets(path):
+    """
+    Load every CSV file in `path` if it is a directory, or else only the
+    file `path`, into a dictionary from filename to its people.
+    """
+    if not os.path.isdir(path):
+        return {path: load_data(path)}
+    return {
+        filename: load_data(os.path.join(path, filename))
+        for filename in sorted(os.listdir(path))
+        if filename.endswith(".csv")
+    }
+
+
+def split_families(people):
+    """
+    Return a list of dictionaries, one per family, splitting `people` into
+    groups connected by parent links. Nobody in one family is related to
+    anybody in another, so each can be solved on its own.
+    """
+    family = {name: name for name in people}
+
+    def find(name):
+        while family[name] != name:
+            family[name] = family[family[name]]
+            name = family[name]
+        return name
+
+    for name in people:
+        for parent in (people[name]["mother"], people[name]["father"]):
+            if parent is not None:
+                family[find(name)] = find(parent)
+
+    families = dict()
+    for name in people:
+        families.setdefault(find(name), dict())[name] = people[name]
+    return list(families.values())
+
+
+def solve_families(datasets, method="eliminate", jobs=1, **options):
+    """
+    Return a dictionary from every dataset in `datasets` to its
+    (probabilities, errors), where errors is None unless `method` samples.
+
+    Every dataset is split into families, which are solved independently
+    by `method` and then merged back, so the cost is a sum over families
+    rather than a product. Families are solved across `jobs` worker
+    processes; sampling within a family then runs in a single process.
+    A `seconds` budget for sampling is shared out between the families
+    in proportion to their size.
+    """
+    tasks = []
+    for dataset, people in datasets.items():
+        for family in split_families(people):
+            tasks.append((dataset, family))
+    # Largest families first, so that no worker is left with one at the end
+    tasks.sort(key=lambda task: len(task[1]), reverse=True)
+
+    jobs = max(1, min(jobs, len(tasks)))
+    if jobs > 1:
+        options = dict(options, processes=1)
+    seconds = options.get("seconds")
+    size = sum(len(family) for _, family in tasks)
+    arguments = [
+        (family, method, options if seconds is None
+         else dict(options, seconds=seconds * len(family) / size))
+        for _, family in tasks
+    ]
+    if jobs == 1:
+        solved = [_solve_family(*argument) for argument in arguments]
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            solved = pool.starmap(_solve_family, arguments, chunksize=1)
+
+    merged = {dataset: (dict(), dict()) for dataset in datasets}
+    for (dataset, _), (probabilities, errors) in zip(tasks, solved):
+        merged[dataset][0].update(probabilities)
+        if errors is not None:
+            merged[dataset][1].update(errors)
+
+    results = dict()
+    for dataset, people in datasets.items():
+        probabilities, errors = merged[dataset]
+        results[dataset] = (
+            {name: probabilities[name] for name in people},
+            {name: errors[name] for name in people} if errors else None
+        )
+    return results
+
+
+def _solve_family(people, method, options):
+    if method in ("likelihood", "gibbs"):
+        return sample_probabilities(
+            people, method, options.get("samples", 10000), options.get("seconds"),
+            options.get("processes", 1), options.get("seed"))
+    if method == "eliminate":
+        return eliminate(people), None
+    if method == "vectorized":
+        return enumerate_probabilities_vectorized(people), None
+    if method == "enumerate":
+        return enumerate_probabilities(people), None
+    raise ValueError(f"unknown method {method!r}")
+
+
 def powerset(s):
     """
     Return a list of all possible subsets of set s.
@@ -193,6 +300,666 @@ def joint_probability(people, one_gene, two_genes, have_trait):
     return JOINT
 
 
+def topological_order(people):
+    """
+    Return everyone's name with parents always before their children.
+    """
+    order = []
+    placed = set()
+    visiting = set()
+    for name in people:
+        stack = [(name, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current in placed:
+                continue
+            if expanded:
+                visiting.discard(current)
+                placed.add(current)
+                order.append(current)
+                continue
+            if current in visiting:
+                raise ValueError(f"{current} is their own ancestor")
+            visiting.add(current)
+            stack.append((current, True))
+            person = people[current]
+            for parent in (person["father"], person["mother"]):
+                if parent is not None and parent not in placed:
+                    stack.append((parent, False))
+    return order
+
+
+def generate_worlds(people):
+    """
+    Lazily yield (genes, p) for every assignment of gene counts with
+    nonzero probability, where `genes` is a tuple of counts in
+    `topological_order(people)` and `p` the joint probability of those
+    counts together with the known traits.
+
+    People are assigned parents first, so each choice multiplies the
+    partial probability by one inheritance term, and a branch is
+    abandoned as soon as that product reaches zero.
+    """
+    order = topological_order(people)
+    terms = _gene_terms(people, order)
+
+    n = len(order)
+    if n == 0:
+        yield (), 1.0
+        return
+    genes = [0] * n
+    partial = [1.0] * (n + 1)
+    choice = [-1] * n
+    level = 0
+    while level >= 0:
+        choice[level] += 1
+        if choice[level] == len(GENES):
+            choice[level] = -1
+            level -= 1
+            continue
+        num = GENES[choice[level]]
+        prior, parents, evidence = terms[level]
+        if parents is None:
+            p = prior[num]
+        else:
+            p = inherit(num, genes[parents[0]], genes[parents[1]])
+        p *= partial[level] * evidence[num]
+        if p == 0:
+            continue
+        genes[level] = num
+        if level == n - 1:
+            yield tuple(genes), p
+        else:
+            partial[level + 1] = p
+            level += 1
+
+
+def enumerate_probabilities(people):
+    """
+    Return gene and trait distributions for everyone, in the same form
+    as `eliminate`, by summing over every world from `generate_worlds`.
+
+    Unknown traits are not enumerated: each world adds the trait
+    probabilities given that person's gene count instead.
+    """
+    order = topological_order(people)
+    gene = [{2: 0, 1: 0, 0: 0} for _ in order]
+    trait = [{True: 0, False: 0} for _ in order]
+    known = [people[name]["trait"] for name in order]
+    for genes, p in generate_worlds(people):
+        for i, num in enumerate(genes):
+            gene[i][num] += p
+            if known[i] is None:
+                trait[i][True] += p * PROBS["trait"][num][True]
+                trait[i][False] += p * PROBS["trait"][num][False]
+            else:
+                trait[i][known[i]] += p
+
+    probabilities = {
+        name: {"gene": gene[i], "trait": trait[i]}
+        for i, name in enumerate(order)
+    }
+    normalize(probabilities)
+    return {name: probabilities[name] for name in people}
+
+
+def log_joint_probabilities(people, genes, traits, order=None):
+    """
+    Return an array of the natural log of `joint_probability` for many
+    worlds at once, with -inf for impossible worlds.
+
+    `genes` is an integer array of shape (worlds, people) of gene counts,
+    and `traits` one of the same shape holding 1 for having the trait,
+    0 for not having it, and -1 to leave it out of the product. Columns
+    follow `order`, which defaults to the order of `people`.
+
+    Requires NumPy.
+    """
+    import numpy as np
+
+    order = list(people) if order is None else order
+    column = {name: i for i, name in enumerate(order)}
+    genes = np.asarray(genes)
+    traits = np.asarray(traits)
+
+    with np.errstate(divide="ignore"):
+        # Lookup tables indexed by gene counts, with traits shifted so
+        # that -1 picks a final column of ones
+        prior = np.log([PROBS["gene"][num] for num in GENES])
+        trait = np.log([[PROBS["trait"][num][False], PROBS["trait"][num][True], 1.0]
+                        for num in GENES])
+        inheritance = np.log([[[inherit(num, mother, father) for father in GENES]
+                               for mother in GENES] for num in GENES])
+
+    founders = [column[name] for name in order if people[name]["mother"] is None]
+    children = [column[name] for name in order if people[name]["mother"] is not None]
+    mothers = [column[people[order[i]]["mother"]] for i in children]
+    fathers = [column[people[order[i]]["father"]] for i in children]
+
+    log_p = trait[genes, np.where(traits < 0, 2, traits)].sum(axis=1)
+    log_p += prior[genes[:, founders]].sum(axis=1)
+    log_p += inheritance[genes[:, children], genes[:, mothers], genes[:, fathers]].sum(axis=1)
+    return log_p
+
+
+def enumerate_probabilities_vectorized(people, batch_size=1 << 16):
+    """
+    Return gene and trait distributions for everyone, in the same form
+    as `enumerate_probabilities`, evaluating every assignment of gene
+    counts `batch_size` worlds at a time with `log_joint_probabilities`.
+
+    Sums are kept relative to the most likely world seen so far, so
+    tiny probabilities of large families do not underflow to zero.
+
+    Requires NumPy.
+    """
+    import numpy as np
+
+    order = list(people)
+    n = len(order)
+    known = np.array([-1 if people[name]["trait"] is None else int(people[name]["trait"])
+                      for name in order], dtype=np.int64)
+    # Probability of the trait given each gene count, for unknown traits
+    have_trait = np.array([PROBS["trait"][num][True] for num in GENES])
+
+    gene = np.zeros((n, len(GENES)))
+    trait = np.zeros(n)
+    total = 0.0
+    shift = -np.inf
+    worlds = len(GENES) ** n
+    for start in range(0, worlds, batch_size):
+        index = np.arange(start, min(start + batch_size, worlds))
+        genes = np.zeros((len(index), n), dtype=np.int64)
+        for i in range(n):
+            genes[:, i] = (index // len(GENES) ** (n - 1 - i)) % len(GENES)
+        log_p = log_joint_probabilities(people, genes, np.broadcast_to(known, genes.shape), order)
+        peak = log_p.max()
+        if peak == -np.inf:
+            continue
+        if peak > shift:
+            # Rescale what has been summed so far to the new reference
+            scale = np.exp(shift - peak)
+            gene *= scale
+            trait *= scale
+            total *= scale
+            shift = peak
+        p = np.exp(log_p - shift)
+        total += p.sum()
+        for i in range(n):
+            gene[i] += np.bincount(genes[:, i], weights=p, minlength=len(GENES))
+            if known[i] < 0:
+                trait[i] += (p * have_trait[genes[:, i]]).sum()
+            elif known[i]:
+                trait[i] += p.sum()
+
+    probabilities = dict()
+    for i, name in enumerate(order):
+        probabilities[name] = {
+            "gene": {num: gene[i][num] / total for num in reversed(GENES)},
+            "trait": {True: trait[i] / total, False: 1 - trait[i] / total},
+        }
+    return probabilities
+
+
+# Batches a Gibbs chain is split into to estimate standard errors
+GIBBS_BATCHES = 20
+
+# Sweeps discarded at the start of each Gibbs chain
+GIBBS_BURN_IN = 100
+
+
+def sample_probabilities(people, method="likelihood", samples=10000,
+                         seconds=None, processes=1, seed=None):
+    """
+    Return (probabilities, errors) estimated by sampling: approximate
+    gene and trait distributions in the same form as `eliminate`, and
+    the standard error of every one of those values.
+
+    `method` is "likelihood" for likelihood weighting, or "gibbs" for
+    Gibbs sampling, with standard errors from batch means. Sampling
+    stops after `samples` samples, or earlier once `seconds` have passed,
+    and is split across `processes` worker processes.
+    """
+    if method not in ("likelihood", "gibbs"):
+        raise ValueError(f"unknown sampling method {method!r}")
+    order = topological_order(people)
+    processes = max(1, processes)
+    share = math.ceil(samples / processes)
+    tasks = [(people, order, method, share, seconds,
+              None if seed is None else seed + worker)
+             for worker in range(processes)]
+    if processes == 1:
+        results = [_sample_worker(*tasks[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(_sample_worker, tasks)
+
+    if method == "likelihood":
+        estimates, errors = _merge_weighted(results, len(order))
+    else:
+        estimates, errors = _merge_batches(results, len(order))
+
+    probabilities = dict()
+    standard_errors = dict()
+    for i, name in enumerate(order):
+        probabilities[name] = {
+            "gene": {num: estimates[i][num] for num in reversed(GENES)},
+            "trait": {True: estimates[i][3], False: 1 - estimates[i][3]},
+        }
+        standard_errors[name] = {
+            "gene": {num: errors[i][num] for num in reversed(GENES)},
+            "trait": {True: errors[i][3], False: errors[i][3]},
+        }
+    return ({name: probabilities[name] for name in people},
+            {name: standard_errors[name] for name in people})
+
+
+def _gene_terms(people, order):
+    """
+    Return, for each person in `order`, their founder prior (or None),
+    the positions of their parents (or None), and the probability of
+    their known trait given each gene count.
+    """
+    position = {name: i for i, name in enumerate(order)}
+    terms = []
+    for name in order:
+        person = people[name]
+        if person["mother"] is None:
+            prior = [PROBS["gene"][num] for num in GENES]
+            parents = None
+        else:
+            prior = None
+            parents = (position[person["mother"]], position[person["father"]])
+        if person["trait"] is None:
+            evidence = [1.0 for num in GENES]
+        else:
+            evidence = [PROBS["trait"][num][person["trait"]] for num in GENES]
+        terms.append((prior, parents, evidence))
+    return terms
+
+
+def _observe(people, order, genes):
+    """
+    Return, per person, indicators of their gene count and the
+    probability of having the trait given it.
+    """
+    values = []
+    for name, num in zip(order, genes):
+        trait = people[name]["trait"]
+        have_trait = PROBS["trait"][num][True] if trait is None else float(trait)
+        values.append([float(num == 0), float(num == 1), float(num == 2), have_trait])
+    return values
+
+
+def _sample_worker(people, order, method, samples, seconds, seed):
+    rng = random.Random(seed)
+    deadline = None if seconds is None else time.monotonic() + seconds
+    terms = _gene_terms(people, order)
+    if method == "likelihood":
+        return _likelihood_weighting(people, order, terms, samples, deadline, rng)
+    return _gibbs(people, order, terms, samples, deadline, rng)
+
+
+def _likelihood_weighting(people, order, terms, samples, deadline, rng):
+    """
+    Draw gene counts parents first, weighting each sample by the
+    probability of the known traits, and return the sums needed to
+    estimate weighted means and their standard errors.
+    """
+    n = len(order)
+    # Sums are kept relative to the largest log weight seen so far, as
+    # weights of large pedigrees underflow a float; the w2 sums twice over
+    sums = {"shift": -math.inf, "w": 0.0, "w2": 0.0,
+            "wx": [[0.0] * 4 for _ in range(n)],
+            "w2x": [[0.0] * 4 for _ in range(n)],
+            "w2x2": [[0.0] * 4 for _ in range(n)]}
+    log_evidence = [[math.log(e) if e > 0 else -math.inf for e in evidence]
+                    for _, _, evidence in terms]
+    genes = [0] * n
+    for sample in range(samples):
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        log_weight = 0.0
+        for i, (prior, parents, evidence) in enumerate(terms):
+            if parents is None:
+                weights = prior
+            else:
+                weights = [inherit(num, genes[parents[0]], genes[parents[1]])
+                           for num in GENES]
+            genes[i] = rng.choices(GENES, weights=weights)[0]
+            log_weight += log_evidence[i][genes[i]]
+        if log_weight > sums["shift"]:
+            _rescale_weighted(sums, sums["shift"] - log_weight)
+            sums["shift"] = log_weight
+        if log_weight == -math.inf:
+            continue
+        weight = math.exp(log_weight - sums["shift"])
+        sums["w"] += weight
+        sums["w2"] += weight * weight
+        for i, values in enumerate(_observe(people, order, genes)):
+            for k, x in enumerate(values):
+                sums["wx"][i][k] += weight * x
+                sums["w2x"][i][k] += weight * weight * x
+                sums["w2x2"][i][k] += weight * weight * x * x
+    return sums
+
+
+def _rescale_weighted(sums, log_scale):
+    """
+    Multiply likelihood weighting sums by exp(`log_scale`) in place.
+    """
+    scale = math.exp(log_scale)
+    sums["w"] *= scale
+    sums["w2"] *= scale * scale
+    for key, factor in (("wx", scale), ("w2x", scale * scale), ("w2x2", scale * scale)):
+        for row in sums[key]:
+            for k in range(4):
+                row[k] *= factor
+
+
+def _gibbs(people, order, terms, samples, deadline, rng):
+    """
+    Run a Gibbs chain over gene counts, resampling one person at a time
+    given everyone else, and return the mean observations of each of
+    `GIBBS_BATCHES` consecutive batches of sweeps.
+    """
+    n = len(order)
+    # (child, is mother, other parent) for everyone's children
+    children = [[] for _ in range(n)]
+    for child, (_, parents, _) in enumerate(terms):
+        if parents is not None:
+            children[parents[0]].append((child, True, parents[1]))
+            children[parents[1]].append((child, False, parents[0]))
+
+    # Start from a possible world drawn parents first
+    genes = [0] * n
+    for i, (prior, parents, evidence) in enumerate(terms):
+        if parents is None:
+            weights = [p * e for p, e in zip(prior, evidence)]
+        else:
+            weights = [inherit(num, genes[parents[0]], genes[parents[1]]) * evidence[num]
+                       for num in GENES]
+        genes[i] = rng.choices(GENES, weights=weights)[0]
+
+    def sweep():
+        for i, (prior, parents, evidence) in enumerate(terms):
+            weights = []
+            for num in GENES:
+                if parents is None:
+                    w = prior[num]
+                else:
+                    w = inherit(num, genes[parents[0]], genes[parents[1]])
+                w *= evidence[num]
+                for child, is_mother, other in children[i]:
+                    if is_mother:
+                        w *= inherit(genes[child], num, genes[other])
+                    else:
+                        w *= inherit(genes[child], genes[other], num)
+                weights.append(w)
+            if sum(weights) > 0:
+                genes[i] = rng.choices(GENES, weights=weights)[0]
+
+    for _ in range(GIBBS_BURN_IN):
+        sweep()
+
+    batch_size = max(1, samples // GIBBS_BATCHES)
+    batches = []
+    totals = [[0.0] * 4 for _ in range(n)]
+    count = 0
+    for sample in range(samples):
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        sweep()
+        for i, values in enumerate(_observe(people, order, genes)):
+            for k, x in enumerate(values):
+                totals[i][k] += x
+        count += 1
+        if count == batch_size:
+            batches.append([[x / count for x in row] for row in totals])
+            totals = [[0.0] * 4 for _ in range(n)]
+            count = 0
+    if count:
+        batches.append([[x / count for x in row] for row in totals])
+    return batches
+
+
+def _merge_weighted(results, n):
+    """
+    Combine likelihood weighting sums into estimates and standard errors.
+    """
+    # Bring every worker's sums to a common scale first
+    shift = max(result["shift"] for result in results)
+    if shift == -math.inf:
+        raise ValueError("no sample was consistent with the known traits")
+    for result in results:
+        _rescale_weighted(result, result["shift"] - shift)
+        result["shift"] = shift
+    w = sum(result["w"] for result in results)
+    w2 = sum(result["w2"] for result in results)
+    estimates = [[0.0] * 4 for _ in range(n)]
+    errors = [[0.0] * 4 for _ in range(n)]
+    for i in range(n):
+        for k in range(4):
+            wx = sum(result["wx"][i][k] for result in results)
+            w2x = sum(result["w2x"][i][k] for result in results)
+            w2x2 = sum(result["w2x2"][i][k] for result in results)
+            estimate = wx / w
+            variance = (w2x2 - 2 * estimate * w2x + estimate * estimate * w2) / (w * w)
+            estimates[i][k] = estimate
+            errors[i][k] = math.sqrt(max(variance, 0.0))
+    return estimates, errors
+
+
+def _merge_batches(results, n):
+    """
+    Combine Gibbs batch means into estimates and standard errors.
+    """
+    batches = [batch for result in results for batch in result]
+    if not batches:
+        raise ValueError("no samples were drawn")
+    estimates = [[0.0] * 4 for _ in range(n)]
+    errors = [[0.0] * 4 for _ in range(n)]
+    for i in range(n):
+        for k in range(4):
+            means = [batch[i][k] for batch in batches]
+            estimate = sum(means) / len(means)
+            estimates[i][k] = estimate
+            if len(means) > 1:
+                variance = sum((m - estimate) ** 2 for m in means) / (len(means) - 1)
+                errors[i][k] = math.sqrt(variance / len(means))
+    return estimates, errors
+
+
+def inherit(num, mother, father):
+    """
+    Return the probability that a child has `num` copies of the gene
+    given that their mother and father have `mother` and `father` copies.
+    """
+    #  probability of passing the gene on from 0, 1 or 2 copies
+    transfer = [PROBS['mutation'], 0.5, 1 - PROBS['mutation']]
+    m, f = transfer[mother], transfer[father]
+    if num == 2:
+        return m * f
+    elif num == 1:
+        return m * (1 - f) + f * (1 - m)
+    return (1 - m) * (1 - f)
+
+
+def eliminate(people):
+    """
+    Return gene and trait distributions for everyone, in the same form
+    as `enumerate_probabilities`, using exact variable elimination.
+
+    The unknowns are each person's number of gene copies. Every person
+    contributes one factor over their own and their parents' copies,
+    weighted by their known trait if any. Eliminating people in min-fill
+    order builds a tree of cliques; a second pass back down that tree gives
+    every person's marginal, so the cost is exponential only in the
+    width of the pedigree rather than in its size.
+    """
+    factors = []
+    for name, person in people.items():
+        if person["mother"] is None:
+            scope = (name,)
+            table = [PROBS["gene"][num] for num in GENES]
+        else:
+            scope = (name, person["mother"], person["father"])
+            table = [inherit(num, mother, father)
+                     for num, mother, father in itertools.product(GENES, repeat=3)]
+        if person["trait"] is not None:
+            table = [p * PROBS["trait"][assignment[0]][person["trait"]]
+                     for p, assignment in zip(table, itertools.product(GENES, repeat=len(scope)))]
+        factors.append((scope, table))
+
+    # Upward pass: eliminating a person multiplies every factor mentioning
+    # them into a clique, whose summed-out message goes to a later clique
+    cliques = []
+    holders = {name: set() for name in people}
+    for index, (scope, _) in enumerate(factors):
+        for name in scope:
+            holders[name].add(("factor", index))
+
+    order = elimination_order(people)
+    available = {("factor", index): factor for index, factor in enumerate(factors)}
+    parent = dict()
+    for step, name in enumerate(order):
+        keys = sorted(holders[name])
+        for key in keys:
+            for other in available[key][0]:
+                holders[other].discard(key)
+        potential = factor_product([available.pop(key) for key in keys])
+        children = [key[1] for key in keys if key[0] == "clique"]
+        message = factor_sum(potential, name)
+        cliques.append({"name": name, "potential": potential,
+                        "message": message, "children": children})
+        for child in children:
+            parent[child] = step
+        key = ("clique", step)
+        available[key] = message
+        for other in message[0]:
+            holders[other].add(key)
+
+    # Downward pass: each clique's belief is its potential times the
+    # message from its parent clique
+    probabilities = dict()
+    beliefs = dict()
+    for step in reversed(range(len(cliques))):
+        clique = cliques[step]
+        belief = clique["potential"]
+        if step in parent:
+            # Remove this clique's own message from the parent's belief
+            incoming = factor_divide(beliefs[parent[step]], clique["message"])
+            downward = factor_marginal(incoming, clique["message"][0])
+            belief = factor_product([belief, downward])
+        beliefs[step] = belief
+
+        marginal = factor_marginal(belief, (clique["name"],))[1]
+        total = sum(marginal)
+        gene = {num: marginal[num] / total for num in reversed(GENES)}
+        trait = people[clique["name"]]["trait"]
+        if trait is None:
+            have_trait = sum(gene[num] * PROBS["trait"][num][True] for num in GENES)
+        else:
+            have_trait = 1.0 if trait else 0.0
+        probabilities[clique["name"]] = {
+            "gene": gene,
+            "trait": {True: have_trait, False: 1 - have_trait},
+        }
+
+    return {name: probabilities[name] for name in people}
+
+
+def elimination_order(people):
+    """
+    Return an order to eliminate people in, greedily picking whoever
+    adds the fewest new edges between their remaining neighbors.
+    """
+    neighbors = {name: set() for name in people}
+    for name, person in people.items():
+        if person["mother"] is not None:
+            family = (name, person["mother"], person["father"])
+            for a, b in itertools.permutations(family, 2):
+                neighbors[a].add(b)
+
+    def fill(name):
+        adjacent = list(neighbors[name])
+        return sum(1 for a, b in itertools.combinations(adjacent, 2)
+                   if b not in neighbors[a])
+
+    order = []
+    while neighbors:
+        name = min(neighbors, key=lambda name: (fill(name), len(neighbors[name]), name))
+        adjacent = neighbors.pop(name)
+        for a in adjacent:
+            neighbors[a].discard(name)
+            neighbors[a].update(adjacent - {a})
+        order.append(name)
+    return order
+
+
+def factor_product(factors):
+    """
+    Return the product of factors, each a (scope, table) pair whose
+    table lists values over all assignments to the scope in
+    `itertools.product(GENES, repeat=len(scope))` order.
+    """
+    scope = []
+    for factor_scope, _ in factors:
+        scope.extend(name for name in factor_scope if name not in scope)
+    positions = [[scope.index(name) for name in factor_scope]
+                 for factor_scope, _ in factors]
+    strides = [[3 ** (len(factor_scope) - 1 - i) for i in range(len(factor_scope))]
+               for factor_scope, _ in factors]
+    table = []
+    for assignment in itertools.product(GENES, repeat=len(scope)):
+        value = 1.0
+        for (_, factor_table), position, stride in zip(factors, positions, strides):
+            value *= factor_table[sum(assignment[p] * s for p, s in zip(position, stride))]
+        table.append(value)
+    return tuple(scope), table
+
+
+def factor_marginal(factor, keep):
+    """
+    Return the factor summed over every variable not in `keep`,
+    with its scope in the order of `keep`.
+    """
+    scope, table = factor
+    keep = tuple(name for name in keep if name in scope)
+    positions = [scope.index(name) for name in keep]
+    marginal = [0.0] * (3 ** len(keep))
+    for value, assignment in zip(table, itertools.product(GENES, repeat=len(scope))):
+        index = 0
+        for p in positions:
+            index = index * 3 + assignment[p]
+        marginal[index] += value
+    return keep, marginal
+
+
+def factor_sum(factor, name):
+    """
+    Return the factor with the variable `name` summed out.
+    """
+    return factor_marginal(factor, tuple(other for other in factor[0] if other != name))
+
+
+def factor_divide(factor, divisor):
+    """
+    Return the factor divided entrywise by a factor over a subset of its
+    scope, taking 0 / 0 to be 0.
+    """
+    scope, table = factor
+    divisor_scope, divisor_table = divisor
+    positions = [scope.index(name) for name in divisor_scope]
+    result = []
+    for value, assignment in zip(table, itertools.product(GENES, repeat=len(scope))):
+        index = 0
+        for p in positions:
+            index = index * 3 + assignment[p]
+        result.append(value / divisor_table[index] if divisor_table[index] else 0.0)
+    return scope, result
+
+
 def update(probabilities, one_gene, two_genes, have_trait, p):
     """
     Add to `probabilities` a new joint probability `p`.
@@ -1,31 +1,79 @@
+import argparse
+import hashlib
+import heapq
+import json
+import math
 import os
+import pickle
 import random
 import re
-import sys
+import tempfile
+import time
+from array import array
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Most files the edges are split into for sorting by `write_edge_list`
+EDGE_BUCKETS = 256
+
+LINK_PATTERN = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Characters read at a time by crawl_concurrent
+CHUNK_SIZE = 1 << 16
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
+    parser = argparse.ArgumentParser(prog="python pagerank.py")
+    parser.add_argument("corpus")
+    parser.add_argument("--damping", type=float, default=DAMPING)
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse the link graph and ranks saved in DIR "
+                             "while the corpus is unchanged")
+    parser.add_argument("--top", metavar="K", type=int,
+                        help="only print the K highest ranked pages")
+    args = parser.parse_args()
+
+    cache = RankCache(args.cache, args.corpus) if args.cache else None
+    corpus = cache.corpus() if cache else crawl(args.corpus)
+
+    def compute(kind, rank):
+        if cache is None:
+            return rank()
+        return cache.ranks(kind, args.damping, rank)
+
+    ranks = compute(f"sample-{SAMPLES}",
+                    lambda: sample_pagerank(corpus, args.damping, SAMPLES))
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
+    print_ranks(ranks, args.top)
+    ranks = compute("iterate", lambda: iterate_pagerank(corpus, args.damping))
     print(f"PageRank Results from Iteration")
-    for page in sorted(ranks):
+    print_ranks(ranks, args.top)
+
+
+def print_ranks(ranks, top=None):
+    """
+    Print ranks by page name, or the `top` highest ranks first.
+    """
+    if top is None:
+        pages = sorted(ranks)
+    else:
+        pages = heapq.nlargest(top, ranks, key=ranks.get)
+    for page in pages:
         print(f"  {page}: {ranks[page]:.4f}")
 
 
-def crawl(directory):
+def crawl(directory, link_graph=False):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
+
+    If `link_graph` is true, return the same mapping as a LinkGraph,
+    which also indexes the links into each page.
     """
     pages = dict()
 
@@ -35,7 +83,7 @@ def crawl(directory):
             continue
         with open(os.path.join(directory, filename)) as f:
             contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
+            links = LINK_PATTERN.findall(contents)
             pages[filename] = set(links) - {filename}
 
     # Only include links to other pages in the corpus
@@ -45,9 +93,226 @@ def crawl(directory):
             if link in pages
         )
 
+    if link_graph:
+        return LinkGraph(pages)
     return pages
 
 
+def crawl_concurrent(directory, workers=8, processes=False, manifest=None,
+                     link_graph=False):
+    """
+    Parse a directory of HTML pages like `crawl`, scanning files
+    concurrently, and return (pages, stats).
+
+    Files are read in chunks by a pool of `workers` threads, or of
+    worker processes if `processes` is true so that link extraction is
+    not bound to one core. If `manifest` names a JSON file, the links of
+    each file are saved there with its size and modification time, and
+    files that have not changed since are not read again.
+
+    `stats` counts the pages scanned and skipped, with the pages scanned
+    per second and elapsed seconds.
+    """
+    start = time.perf_counter()
+    previous = dict()
+    if manifest is not None:
+        try:
+            with open(manifest) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = dict()
+
+    entries = dict()
+    pending = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".html"):
+            continue
+        stat = entry.stat()
+        known = previous.get(entry.name)
+        if (known is not None and known["size"] == stat.st_size
+                and known["mtime_ns"] == stat.st_mtime_ns):
+            entries[entry.name] = known
+        else:
+            entries[entry.name] = {"size": stat.st_size,
+                                   "mtime_ns": stat.st_mtime_ns}
+            pending.append(entry.name)
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(workers) as pool:
+        paths = [os.path.join(directory, filename) for filename in pending]
+        for filename, links in zip(pending, pool.map(_scan_links, paths, chunksize=16)):
+            entries[filename]["links"] = sorted(links)
+
+    if manifest is not None and (pending or len(entries) != len(previous)):
+        tmp = f"{manifest}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, manifest)
+
+    # Only include links to other pages in the corpus
+    pages = dict()
+    for filename, entry in entries.items():
+        pages[filename] = set(
+            link for link in entry["links"]
+            if link in entries and link != filename
+        )
+    if link_graph:
+        pages = LinkGraph(pages)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "pages": len(entries),
+        "scanned": len(pending),
+        "skipped": len(entries) - len(pending),
+        "seconds": elapsed,
+        "pages_per_second": len(pending) / elapsed if elapsed else 0.0,
+    }
+    return pages, stats
+
+
+def _scan_links(path):
+    """
+    Return the set of link targets in an HTML file, read in chunks.
+    """
+    links = set()
+    carry = ""
+    with open(path, errors="replace") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            text = carry + chunk
+            # Hold back the last tag, which may continue in the next chunk
+            cut = text.rfind("<")
+            if cut == -1:
+                cut = len(text)
+            links.update(LINK_PATTERN.findall(text, 0, cut))
+            carry = text[cut:]
+    links.update(LINK_PATTERN.findall(carry))
+    return links
+
+
+class RankCache():
+    """
+    Directory of crawled link graphs and computed PageRank values for a
+    corpus, keyed by a fingerprint of its HTML files so that anything
+    saved for an older version of the corpus is never reused.
+    """
+
+    def __init__(self, path, directory):
+        self.path = path
+        self.directory = directory
+        self.fingerprint = corpus_fingerprint(directory)
+        os.makedirs(path, exist_ok=True)
+
+    def corpus(self):
+        """
+        Return the crawled corpus, crawling it only if not yet saved.
+        """
+        filename = os.path.join(self.path, f"{self.fingerprint}.corpus.pickle")
+        try:
+            with open(filename, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        corpus = crawl(self.directory)
+        self._write(filename, pickle.dumps(corpus, protocol=pickle.HIGHEST_PROTOCOL))
+        return corpus
+
+    def ranks(self, kind, damping_factor, compute):
+        """
+        Return the saved PageRank values of the given `kind` and damping
+        factor, or save and return those from calling `compute()`.
+        """
+        filename = os.path.join(
+            self.path, f"{self.fingerprint}.{kind}.{damping_factor!r}.json")
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        ranks = compute()
+        self._write(filename, json.dumps(ranks).encode())
+        return ranks
+
+    def _write(self, filename, data):
+        tmp = f"{filename}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+
+
+def corpus_fingerprint(directory):
+    """
+    Return a hash of the name, size and modification time of every
+    HTML file in a corpus directory.
+    """
+    digest = hashlib.sha256()
+    entries = sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir(directory) if entry.name.endswith(".html")
+    )
+    for name, size, mtime in entries:
+        digest.update(f"{name}\0{size}\0{mtime}\n".encode())
+    return digest.hexdigest()[:32]
+
+
+class LinkGraph(Mapping):
+    """
+    Read-only corpus mapping each page to the set of pages it links to,
+    which also keeps the reverse links and out-degrees.
+
+    Pages are numbered in sorted order, and both directions are stored as
+    CSR arrays: the pages linked to by page `i` are
+    `forward_links[forward_offsets[i]:forward_offsets[i + 1]]`, and those
+    linking to it are the same slice of `reverse_offsets`/`reverse_links`.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = {page: frozenset(links) for page, links in corpus.items()}
+        self.pages = sorted(self.corpus)
+        self.index = {page: i for i, page in enumerate(self.pages)}
+
+        self.forward_offsets = array("q", [0])
+        self.forward_links = array("q")
+        self.out_degree = array("q")
+        sources = [[] for _ in self.pages]
+        for i, page in enumerate(self.pages):
+            links = sorted(self.index[link] for link in self.corpus[page])
+            self.forward_links.extend(links)
+            self.forward_offsets.append(len(self.forward_links))
+            self.out_degree.append(len(links))
+            for link in links:
+                sources[link].append(i)
+
+        self.reverse_offsets = array("q", [0])
+        self.reverse_links = array("q")
+        for links in sources:
+            self.reverse_links.extend(links)
+            self.reverse_offsets.append(len(self.reverse_links))
+
+        self._incoming = {
+            page: frozenset(self.pages[j] for j in self.reverse_links[
+                self.reverse_offsets[i]:self.reverse_offsets[i + 1]])
+            for i, page in enumerate(self.pages)
+        }
+
+    def __getitem__(self, page):
+        return self.corpus[page]
+
+    def __iter__(self):
+        return iter(self.corpus)
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def incoming(self, page):
+        """
+        Return the set of pages that link to `page`.
+        """
+        return self._incoming[page]
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -108,8 +373,57 @@ def sample_pagerank(corpus, damping_factor, n):
     return sample
 
 
+def sample_pagerank_vectorized(corpus, damping_factor, n, surfers=1024, seed=None):
+    """
+    Return PageRank values for each page by simulating `surfers` random
+    surfers in parallel with NumPy until `n` pages have been visited in
+    total, and counting how often each page was visited.
+
+    Each surfer starts a walk on a random page of the corpus. Each step,
+    it follows a random link of its page with probability
+    `damping_factor`, and otherwise (or if the page has no links) the
+    walk ends and a new one starts on a random page. Only whole walks are
+    counted, since cutting walks short would favour the pages they start on.
+
+    Requires NumPy.
+    """
+    import numpy as np
+
+    if not isinstance(corpus, LinkGraph):
+        corpus = LinkGraph(corpus)
+    rng = np.random.default_rng(seed)
+    N = len(corpus.pages)
+    offsets = np.frombuffer(corpus.forward_offsets, dtype=np.int64)
+    links = np.frombuffer(corpus.forward_links, dtype=np.int64)
+    out_degree = np.frombuffer(corpus.out_degree, dtype=np.int64)
+
+    surfers = max(1, min(surfers, n))
+    counts = np.zeros(N, dtype=np.int64)
+    position = rng.integers(N, size=surfers)
+    visited = 0
+    while position.size:
+        counts += np.bincount(position, minlength=N)
+        visited += position.size
+
+        # Links are uniform per page, so a scaled uniform draw picks one exactly
+        degree = out_degree[position]
+        follow = (rng.random(position.size) < damping_factor) & (degree > 0)
+        choice = offsets[position] + (rng.random(position.size) * degree).astype(np.int64)
+        position = links[choice[follow]]
+
+        # Surfers whose walk ended start new ones until `n` pages are visited,
+        # and after that the remaining walks run to their end
+        if visited < n:
+            position = np.concatenate(
+                (position, rng.integers(N, size=surfers - position.size)))
+
+    return dict(zip(corpus.pages, (counts / counts.sum()).tolist()))
+
+
 #  returns all those pages having link to given page
 def incoming(corpus, page):
+    if isinstance(corpus, LinkGraph):
+        return list(corpus.incoming(page))
     incomings = list()
     for pg, outgoings in corpus.items():
         if page in outgoings:
@@ -158,5 +472,448 @@ def iterate_pagerank(corpus, damping_factor):
                 rank_new[page] = (1 - damping_factor) / N
 
 
+class IncrementalPageRank():
+    """
+    PageRank values kept up to date as pages and links change.
+
+    Each update starts from the previous values and recomputes only the
+    pages whose incoming rank changed by more than `tolerance`, pushing
+    changes along links until nothing moves. Adding or removing pages
+    changes the random-jump share of every page, as does a page gaining
+    its first link or losing its last, so those updates touch the whole
+    corpus, but still start from the previous values.
+    """
+
+    def __init__(self, corpus, damping_factor, ranks=None, tolerance=1e-8):
+        self.damping_factor = damping_factor
+        self.tolerance = tolerance
+        self.links = {page: set(links) for page, links in corpus.items()}
+        self.incoming = {page: set() for page in corpus}
+        for page, links in self.links.items():
+            for link in links:
+                self.incoming[link].add(page)
+        N = len(self.links)
+        self.rank = {page: 1 / N for page in self.links}
+        if ranks is not None:
+            self.rank.update((page, ranks[page]) for page in self.links if page in ranks)
+        # Pages recomputed by the last update
+        self.recomputed = 0
+        self._propagate(set(self.links))
+
+    def ranks(self):
+        """
+        Return the current PageRank values, normalized to sum to 1.
+        """
+        total = sum(self.rank.values())
+        return {page: rank / total for page, rank in self.rank.items()}
+
+    def update(self, add_pages=(), remove_pages=(), add_links=(), remove_links=()):
+        """
+        Apply changes to the corpus and return the new PageRank values.
+
+        `add_pages` and `remove_pages` are pages, and `add_links` and
+        `remove_links` are (page, linked page) pairs. Links to pages
+        outside the corpus and links from a page to itself are ignored.
+        """
+        affected = set()
+        resize = False
+
+        for page in add_pages:
+            if page not in self.links:
+                self.links[page] = set()
+                self.incoming[page] = set()
+                self.rank[page] = 1 / len(self.links)
+                resize = True
+        for page in remove_pages:
+            if page not in self.links:
+                continue
+            for source in self.incoming.pop(page):
+                self.links[source].discard(page)
+                affected.update(self.links[source])
+            for link in self.links.pop(page):
+                self.incoming[link].discard(page)
+                affected.add(link)
+            del self.rank[page]
+            resize = True
+
+        for page, link in add_links:
+            if page in self.links and link in self.links and page != link:
+                # A page gaining its first link stops sharing its rank
+                # with every page, which changes the random-jump share
+                if not self.links[page]:
+                    resize = True
+                self.links[page].add(link)
+                self.incoming[link].add(page)
+                affected.update(self.links[page])
+        for page, link in remove_links:
+            if page in self.links and link in self.links[page]:
+                self.links[page].discard(link)
+                self.incoming[link].discard(page)
+                if not self.links[page]:
+                    resize = True
+                affected.update(self.links[page])
+                affected.add(link)
+
+        affected &= set(self.links)
+        if resize:
+            affected = set(self.links)
+        self._propagate(affected)
+        return self.ranks()
+
+    def _propagate(self, affected):
+        """
+        Recompute `affected` pages, and the pages their changes reach,
+        until no value changes by more than the tolerance.
+        """
+        d = self.damping_factor
+        N = len(self.links)
+        links, incoming, rank = self.links, self.incoming, self.rank
+
+        # Rank held by pages without links is shared by every page
+        dangling = sum(rank[page] for page in links if not links[page])
+        base = ((1 - d) + d * dangling) / N
+
+        queue = deque(affected)
+        queued = set(affected)
+        self.recomputed = 0
+        while queue:
+            page = queue.popleft()
+            queued.discard(page)
+            self.recomputed += 1
+            new = base + d * sum(rank[source] / len(links[source])
+                                 for source in incoming[page])
+            change = new - rank[page]
+            if abs(change) <= self.tolerance:
+                continue
+            rank[page] = new
+            if links[page]:
+                followers = links[page]
+            else:
+                # A page without links shares its rank with every page
+                dangling += change
+                new_base = ((1 - d) + d * dangling) / N
+                if abs(new_base - base) <= self.tolerance:
+                    continue
+                base = new_base
+                followers = links
+            for follower in followers:
+                if follower not in queued:
+                    queued.add(follower)
+                    queue.append(follower)
+
+
+def transition_matrix(corpus):
+    """
+    Return (pages, matrix, dangling) for a corpus, where `pages` lists
+    the pages in index order, `matrix` is a sparse CSR matrix whose entry
+    [i, j] is the probability of following a link from page j to page i,
+    and `dangling` is a boolean array marking pages without links.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if not isinstance(corpus, LinkGraph):
+        corpus = LinkGraph(corpus)
+    N = len(corpus.pages)
+    # Reverse links are already grouped by target page, i.e. CSR rows
+    offsets = np.frombuffer(corpus.reverse_offsets, dtype=np.int64)
+    sources = np.frombuffer(corpus.reverse_links, dtype=np.int64)
+    out_degree = np.frombuffer(corpus.out_degree, dtype=np.int64)
+    weights = 1.0 / out_degree[sources] if len(sources) else np.zeros(0)
+    matrix = sparse.csr_matrix((weights, sources, offsets), shape=(N, N))
+    return corpus.pages, matrix, out_degree == 0
+
+
+def iterate_pagerank_sparse(corpus, damping_factor, tolerance=0.001):
+    """
+    Return PageRank values for each page by vectorized power iteration
+    over a sparse transition matrix, until no value changes by more
+    than `tolerance`. Pages without links are treated as linking to
+    every page, as in `iterate_pagerank`.
+
+    Requires NumPy and SciPy.
+    """
+    import numpy as np
+
+    pages, matrix, dangling = transition_matrix(corpus)
+    N = len(pages)
+    rank = np.full(N, 1 / N)
+    while True:
+        rank_new = ((1 - damping_factor) / N
+                    + damping_factor * (matrix @ rank + rank[dangling].sum() / N))
+        converged = np.abs(rank_new - rank).max() <= tolerance
+        rank = rank_new
+        if converged:
+            break
+    rank /= rank.sum()
+    return dict(zip(pages, rank.tolist()))
+
+
+SOLVERS = ("power", "gauss-seidel", "extrapolation")
+
+
+def solve_pagerank(corpus, damping_factor, method="power", tolerance=1e-8,
+                   max_iterations=1000, extrapolation_period=10):
+    """
+    Return (ranks, diagnostics) computed with the chosen solver, one of:
+
+        * "power": plain power iteration,
+        * "gauss-seidel": Gauss-Seidel sweeps, using values updated
+          earlier in the same sweep,
+        * "extrapolation": power iteration with quadratic extrapolation
+          every `extrapolation_period` iterations.
+
+    Iteration stops once the L1 norm of the change between iterations
+    is at most `tolerance`, or after `max_iterations` iterations.
+    `diagnostics` holds the method, iteration count, whether it
+    converged, the seconds spent building the matrices, and the residual
+    and seconds taken of every iteration.
+
+    Requires NumPy and SciPy.
+    """
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve_triangular
+
+    if method not in SOLVERS:
+        raise ValueError(f"unknown solver {method!r}, expected one of {SOLVERS}")
+    start = time.perf_counter()
+    pages, matrix, dangling = transition_matrix(corpus)
+    N = len(pages)
+    d = damping_factor
+
+    if method == "gauss-seidel":
+        # Solve (I - dM) x = b by splitting off the lower triangle
+        lower = (sparse.identity(N, format="csr") - d * sparse.tril(matrix)).tocsr()
+        upper = (d * sparse.triu(matrix, k=1)).tocsr()
+
+    rank = np.full(N, 1 / N)
+    history = []
+    diagnostics = {"method": method, "iterations": 0, "converged": False,
+                   "setup_seconds": time.perf_counter() - start,
+                   "residuals": [], "seconds": []}
+    for iteration in range(1, max_iterations + 1):
+        start = time.perf_counter()
+        teleport = ((1 - d) + d * rank[dangling].sum()) / N
+        if method == "gauss-seidel":
+            rank_new = spsolve_triangular(lower, upper @ rank + teleport, lower=True)
+        else:
+            rank_new = teleport + d * (matrix @ rank)
+
+        if method == "extrapolation":
+            history = (history + [rank_new])[-4:]
+            if len(history) == 4 and iteration % extrapolation_period == 0:
+                rank_new = _quadratic_extrapolation(history)
+
+        residual = float(np.abs(rank_new - rank).sum())
+        rank = rank_new
+        diagnostics["iterations"] = iteration
+        diagnostics["residuals"].append(residual)
+        diagnostics["seconds"].append(time.perf_counter() - start)
+        if residual <= tolerance:
+            diagnostics["converged"] = True
+            break
+
+    rank /= rank.sum()
+    return dict(zip(pages, rank.tolist())), diagnostics
+
+
+def _quadratic_extrapolation(history):
+    """
+    Return the quadratic extrapolation (Kamvar et al., 2003) of the
+    last four power iterates in `history`.
+    """
+    import numpy as np
+
+    x0, x1, x2, x3 = history
+    Y = np.column_stack((x1 - x0, x2 - x0))
+    gamma = np.linalg.lstsq(Y, -(x3 - x0), rcond=None)[0]
+    gamma1, gamma2, gamma3 = gamma[0], gamma[1], 1.0
+    beta0 = gamma1 + gamma2 + gamma3
+    beta1 = gamma2 + gamma3
+    beta2 = gamma3
+    extrapolated = np.abs(beta0 * x1 + beta1 * x2 + beta2 * x3)
+    return extrapolated / extrapolated.sum()
+
+
+def personalized_pagerank(corpus, damping_factor, personalizations,
+                          tolerance=1e-8, max_iterations=1000):
+    """
+    Return a list of PageRank dictionaries, one per personalization,
+    all computed together as sparse matrix-matrix products.
+
+    Each personalization is either a dictionary of page weights or a
+    collection of seed pages weighted equally. The random surfer jumps
+    according to those weights instead of uniformly, and so does a surfer
+    on a page without links. Iteration stops once every ranking changes
+    by at most `tolerance` in L1 norm, or after `max_iterations`.
+
+    Requires NumPy and SciPy.
+    """
+    import numpy as np
+
+    pages, matrix, dangling = transition_matrix(corpus)
+    index = {page: i for i, page in enumerate(pages)}
+    N, K = len(pages), len(personalizations)
+
+    teleport = np.zeros((N, K))
+    for k, personalization in enumerate(personalizations):
+        if not isinstance(personalization, Mapping):
+            personalization = dict.fromkeys(personalization, 1)
+        for page, weight in personalization.items():
+            if page not in index:
+                raise ValueError(f"page {page!r} is not in the corpus")
+            teleport[index[page], k] = weight
+        total = teleport[:, k].sum()
+        if total <= 0:
+            raise ValueError(f"personalization {k} has no positive weight")
+        teleport[:, k] /= total
+
+    d = damping_factor
+    rank = teleport.copy()
+    for _ in range(max_iterations):
+        # Jump probability per column: teleporting plus surfing off dangling pages
+        jump = (1 - d) + d * rank[dangling].sum(axis=0)
+        rank_new = d * (matrix @ rank) + teleport * jump
+        residual = np.abs(rank_new - rank).sum(axis=0).max()
+        rank = rank_new
+        if residual <= tolerance:
+            break
+
+    rank /= rank.sum(axis=0)
+    return [dict(zip(pages, rank[:, k].tolist())) for k in range(K)]
+
+
+def write_edge_list(corpus, path, chunk_size=1 << 20):
+    """
+    Write the links of a corpus to the directory `path` for
+    `iterate_pagerank_out_of_core`: page names one per line in
+    `pages.txt`, and (source, target) page numbers as native 64-bit
+    integer pairs sorted by target in `edges.bin`.
+
+    `corpus` is a mapping from pages to their links, or an iterable of
+    (page, links) pairs such as `iter_links` yields, so that the corpus
+    need not fit in memory. Links are spooled to disk until every page
+    is known, then sorted in buckets of about `chunk_size` edges. Links
+    to pages outside the corpus and from a page to itself are ignored.
+    """
+    if isinstance(corpus, Mapping):
+        corpus = corpus.items()
+    os.makedirs(path, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=path) as spool:
+        # Number the pages in order, spooling their links by page number
+        index = dict()
+        spooled = os.path.join(spool, "links.txt")
+        links_written = 0
+        with open(os.path.join(path, "pages.txt"), "w", encoding="utf-8") as f, \
+                open(spooled, "w", encoding="utf-8") as out:
+            for page, links in corpus:
+                index[page] = len(index)
+                f.write(page + "\n")
+                for link in set(links):
+                    if link != page:
+                        out.write(f"{index[page]}\t{link}\n")
+                        links_written += 1
+
+        # Split the edges into files by ranges of targets
+        buckets = max(1, min(EDGE_BUCKETS, math.ceil(links_written / chunk_size)))
+        width = max(1, math.ceil(len(index) / buckets))
+        bucket_files = [open(os.path.join(spool, f"{bucket}.bin"), "wb")
+                        for bucket in range(buckets)]
+        try:
+            pending = [array("q") for _ in range(buckets)]
+            with open(spooled, encoding="utf-8") as f:
+                for line in f:
+                    source, link = line.rstrip("\n").split("\t", 1)
+                    target = index.get(link)
+                    if target is None:
+                        continue
+                    bucket = target // width
+                    pending[bucket].extend((int(source), target))
+                    if len(pending[bucket]) >= 1 << 16:
+                        pending[bucket].tofile(bucket_files[bucket])
+                        pending[bucket] = array("q")
+            for bucket, edges in enumerate(pending):
+                edges.tofile(bucket_files[bucket])
+        finally:
+            for bucket_file in bucket_files:
+                bucket_file.close()
+
+        # Each bucket is small enough to sort in memory
+        with open(os.path.join(path, "edges.bin"), "wb") as out:
+            for bucket in range(buckets):
+                filename = os.path.join(spool, f"{bucket}.bin")
+                edges = array("q")
+                with open(filename, "rb") as f:
+                    edges.frombytes(f.read())
+                pairs = sorted(zip(edges[1::2], edges[0::2]))
+                edges = array("q")
+                for target, source in pairs:
+                    edges.extend((source, target))
+                edges.tofile(out)
+
+
+def iter_links(directory):
+    """
+    Lazily yield (page, links) for every HTML file in `directory`, one
+    file at a time, with the set of link targets found in the file.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".html"):
+                yield entry.name, _scan_links(entry.path)
+
+
+def iterate_pagerank_out_of_core(path, damping_factor, tolerance=1e-8,
+                                 max_iterations=1000, block_size=1 << 20):
+    """
+    Return PageRank values for each page of an edge list written by
+    `write_edge_list`, by power iteration that streams the memory-mapped
+    edges `block_size` at a time, so only the rank vectors need to fit
+    in memory. Iteration stops once the values change by at most
+    `tolerance` in L1 norm, or after `max_iterations`.
+
+    Requires NumPy.
+    """
+    import numpy as np
+
+    with open(os.path.join(path, "pages.txt"), encoding="utf-8") as f:
+        pages = f.read().splitlines()
+    N = len(pages)
+    filename = os.path.join(path, "edges.bin")
+    if os.path.getsize(filename):
+        edges = np.memmap(filename, dtype=np.int64, mode="r").reshape(-1, 2)
+    else:
+        edges = np.zeros((0, 2), dtype=np.int64)
+
+    # One pass over the sources gives the out-degrees
+    out_degree = np.zeros(N, dtype=np.int64)
+    for start in range(0, len(edges), block_size):
+        sources = edges[start:start + block_size, 0]
+        counts = np.bincount(sources)
+        out_degree[:len(counts)] += counts
+    dangling = out_degree == 0
+    share = np.zeros(N)
+
+    d = damping_factor
+    rank = np.full(N, 1 / N)
+    for _ in range(max_iterations):
+        np.divide(rank, out_degree, out=share, where=~dangling)
+        rank_new = np.full(N, ((1 - d) + d * rank[dangling].sum()) / N)
+        for start in range(0, len(edges), block_size):
+            # Edges are sorted by target, so a block adds to a short range
+            block = edges[start:start + block_size]
+            low, high = block[:, 1].min(), block[:, 1].max() + 1
+            rank_new[low:high] += d * np.bincount(
+                block[:, 1] - low, weights=share[block[:, 0]], minlength=high - low)
+        residual = np.abs(rank_new - rank).sum()
+        rank = rank_new
+        if residual <= tolerance:
+            break
+
+    rank /= rank.sum()
+    return dict(zip(pages, rank.tolist()))
+
+
 if __name__ == "__main__":
     main()
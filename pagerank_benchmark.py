@@ -0,0 +1,211 @@
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+
+import pagerank
+
+DAMPING = pagerank.DAMPING
+
+# Rounds of popularity-weighted draws for a page's links before the rest
+# are picked uniformly
+DRAW_ROUNDS = 8
+
+# Engines by name, with the largest corpus each is timed on. The original
+# sampler costs O(samples * pages), so it takes at most pagerank.SAMPLES
+ENGINES = {
+    "sample": (lambda corpus, samples: pagerank.sample_pagerank(
+        corpus, DAMPING, min(samples, pagerank.SAMPLES)), 2000),
+    "iterate": (lambda corpus, samples: pagerank.iterate_pagerank(
+        corpus, DAMPING), 5000),
+    "sample-vectorized": (lambda corpus, samples: pagerank.sample_pagerank_vectorized(
+        corpus, DAMPING, samples), None),
+    "sparse": (lambda corpus, samples: pagerank.iterate_pagerank_sparse(
+        corpus, DAMPING), None),
+    "power": (lambda corpus, samples: pagerank.solve_pagerank(
+        corpus, DAMPING, "power")[0], None),
+    "gauss-seidel": (lambda corpus, samples: pagerank.solve_pagerank(
+        corpus, DAMPING, "gauss-seidel")[0], None),
+    "extrapolation": (lambda corpus, samples: pagerank.solve_pagerank(
+        corpus, DAMPING, "extrapolation")[0], None),
+    "out-of-core": (lambda corpus, samples: _out_of_core(corpus), None),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python pagerank_benchmark.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of pages in the synthetic corpora")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                        default=list(ENGINES))
+    parser.add_argument("--links", type=float, default=8,
+                        help="mean distinct links per page with links, "
+                             "at most the corpus size minus one")
+    parser.add_argument("--dangling", type=float, default=0.1,
+                        help="fraction of pages without links")
+    parser.add_argument("--exponent", type=float, default=2.1,
+                        help="power-law exponent of the link degrees")
+    parser.add_argument("--samples", type=int, default=100000,
+                        help="samples for the sampling engines")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="largest difference from the reference that agrees")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--baseline",
+                        help="JSON lines from an earlier run to compare timings with")
+    parser.add_argument("--max-slowdown", type=float, default=1.5,
+                        help="fail if an engine is this many times slower than baseline")
+    args = parser.parse_args()
+
+    results = []
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for size in args.sizes:
+            corpus = power_law_corpus(size, args.links, args.dangling,
+                                      args.exponent, args.seed)
+            for result in benchmark(corpus, args.engines, args.samples, args.tolerance):
+                result.update(pages=size, links=sum(map(len, corpus.values())))
+                results.append(result)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if args.output:
+            out.close()
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.max_slowdown)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+    if any(result.get("agrees") is False for result in results):
+        sys.exit("Some engines disagree with the reference ranking.")
+
+
+def power_law_corpus(n, mean_links=8, dangling=0.1, exponent=2.1, seed=None):
+    """
+    Return a synthetic corpus of `n` pages named "<i>.html" whose
+    numbers of outgoing and incoming links both follow a power law with
+    the given `exponent`, and where a `dangling` fraction of pages have
+    no links at all. Pages with links link to `mean_links` distinct
+    other pages on average, or to all of them if there are fewer.
+    """
+    rng = random.Random(seed)
+
+    # Zipf-like popularity decides how often a page is linked to
+    popularity = [(i + 1) ** (-1 / (exponent - 1)) for i in range(n)]
+    rng.shuffle(popularity)
+    cumulative = []
+    total = 0
+    for weight in popularity:
+        total += weight
+        cumulative.append(total)
+
+    # Pareto out-degrees with shape exponent - 1, scaled so that their mean
+    # after rounding and capping at the other n - 1 pages is `mean_links`
+    linked = [rng.random() >= dangling for _ in range(n)]
+    draws = [rng.paretovariate(exponent - 1) for _ in range(sum(linked))]
+    degrees = _scale_degrees(draws, min(mean_links, n - 1), n - 1)
+
+    pages = [f"{i}.html" for i in range(n)]
+    corpus = dict()
+    degrees = iter(degrees)
+    for i, page in enumerate(pages):
+        if not linked[i]:
+            corpus[page] = set()
+            continue
+        degree = next(degrees)
+        targets = set()
+        for _ in range(DRAW_ROUNDS):
+            missing = degree - len(targets)
+            if not missing:
+                break
+            targets.update(j for j in rng.choices(range(n), cum_weights=cumulative, k=missing)
+                           if j != i)
+        if len(targets) < degree:
+            # Popular pages keep being drawn again, so fill up uniformly
+            rest = [j for j in range(n) if j != i and j not in targets]
+            targets.update(rng.sample(rest, degree - len(targets)))
+        corpus[page] = set(pages[j] for j in targets)
+    return corpus
+
+
+def _scale_degrees(draws, mean, cap):
+    """
+    Return the `draws` scaled, rounded down to at least 1 and capped at
+    `cap`, with the scale found by bisection so that their mean is `mean`.
+    """
+    def degrees(scale):
+        return [min(cap, max(1, int(scale * draw))) for draw in draws]
+
+    if not draws:
+        return []
+    low, high = 0, mean
+    while sum(degrees(high)) < mean * len(draws) and high < cap:
+        high *= 2
+    for _ in range(50):
+        middle = (low + high) / 2
+        if sum(degrees(middle)) < mean * len(draws):
+            low = middle
+        else:
+            high = middle
+    return degrees(high)
+
+
+def benchmark(corpus, engines, samples, tolerance):
+    """
+    Yield a result dictionary per engine with its running time, and its
+    largest and total difference from a tightly converged reference.
+    """
+    reference = pagerank.solve_pagerank(corpus, DAMPING, tolerance=1e-12)[0]
+    for name in engines:
+        engine, limit = ENGINES[name]
+        result = {"engine": name}
+        if limit is not None and len(corpus) > limit:
+            result["skipped"] = f"more than {limit} pages"
+            yield result
+            continue
+        start = time.perf_counter()
+        ranks = engine(corpus, samples)
+        result["seconds"] = time.perf_counter() - start
+        errors = [abs(ranks[page] - reference[page]) for page in corpus]
+        result["max_error"] = max(errors)
+        result["l1_error"] = sum(errors)
+        result["agrees"] = result["max_error"] <= tolerance
+        yield result
+
+
+def compare(results, baseline, max_slowdown):
+    """
+    Return descriptions of the results that took more than
+    `max_slowdown` times as long as the same engine and size in `baseline`.
+    """
+    previous = {(result["pages"], result["engine"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["pages"], result["engine"]))
+        if before is None or "seconds" not in before or "seconds" not in result:
+            continue
+        if result["seconds"] > max_slowdown * before["seconds"]:
+            regressions.append(
+                f"{result['engine']} on {result['pages']} pages took "
+                f"{result['seconds']:.3f}s, baseline {before['seconds']:.3f}s"
+            )
+    return regressions
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _out_of_core(corpus):
+    with tempfile.TemporaryDirectory() as path:
+        pagerank.write_edge_list(corpus, path)
+        return pagerank.iterate_pagerank_out_of_core(path, DAMPING)
+
+
+if __name__ == "__main__":
+    main()